@@ -1,6 +1,28 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
+from pathlib import Path
+
+# Optional: MinMaxLTTB downsampling for the time-series chart. Plotly line
+# rendering slows down past a few thousand points, and MinMaxLTTB picks a
+# fixed-size subset that preserves the visual shape of the series. Without
+# tsdownsample installed the full series is sent to the browser as before.
+try:
+    from tsdownsample import MinMaxLTTBDownsampler
+except ImportError:
+    MinMaxLTTBDownsampler = None
+
+# Optional: Numba JIT for the grouped-sum kernel used by the breakdowns.
+# Without numba the np.bincount path below is used instead.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Maximum number of points to draw on the time-series chart
+MAX_CHART_POINTS = 1500
 
 # --- Page Configuration ---
 # Set page layout to wide
@@ -10,37 +32,93 @@ st.set_page_config(
 )
 
 # --- Data Loading and Preparation ---
+def top_emitting_provinces(df_clean, n=5):
+
+    # Provinces ranked by total emissions; used as the default province filter
+    totals = df_clean.groupby('State', observed=True)['Emissions'].sum()
+    return totals.nlargest(n).index.tolist()
+
+def filter_options(df_clean):
+
+    # The unique choices for the sidebar filters, computed once per data load
+    # so reruns reuse the same lists. unique() on a categorical is free via
+    # .cat.categories, and Year is sorted here rather than on every rerun.
+    provinces = df_clean['State'].cat.categories.tolist()
+    sectors = df_clean['Sector'].cat.categories.tolist()
+    years = np.sort(df_clean['Year'].unique()).tolist()
+    return provinces, sectors, years
+
 @st.cache_data  # Cache the data loading to improve performance
 def load_data(filepath):
 
     # Loads and prepares the CO2 emissions data.
     # Define the columns we want to load
     relevant_cols = ['State', 'Date', 'Sector', 'MtCO2 per day']
-    
+
+    # --- Fast Path: Parquet Sidecar ---
+    # Parquet is columnar and decoded in C via pyarrow, so reading it is far
+    # faster than parsing the Excel file. We write this sidecar at the end of
+    # the first successful Excel load, so every later cold start skips Excel
+    # entirely. The sidecar stores the already-processed frame, dtypes included.
+    parquet_path = Path(filepath).with_suffix('.parquet')
+    if parquet_path.exists():
+        try:
+            df_clean = pd.read_parquet(parquet_path)
+            provinces, sectors, years = filter_options(df_clean)
+            return df_clean, top_emitting_provinces(df_clean), provinces, sectors, years
+        except Exception:
+            # Sidecar unreadable (e.g. pyarrow missing) - fall back to Excel
+            pass
+
     try:
         # Use pd.read_excel to read the file, as it's an Excel file
         # 'usecols' will find these columns regardless of where they are
-        df = pd.read_excel(
-            filepath, 
-            usecols=relevant_cols
+        # Prefer the Rust-based 'calamine' engine (python-calamine), which streams
+        # the sheet instead of building a full in-memory DOM like openpyxl does.
+        # Passing dtype/parse_dates here means the columns come back already
+        # typed, so we skip a separate conversion pass later.
+        read_kwargs = dict(
+            usecols=relevant_cols,
+            dtype={'State': 'category', 'Sector': 'category'},
+            parse_dates=['Date']
         )
-        
-        # Select only the columns we need (read_excel might load others if not specified)
-        df_clean = df[relevant_cols].copy()
+        # usecols= already projects the frame down to these columns, so the
+        # read result is used directly - no defensive re-select-and-copy
+        try:
+            df_clean = pd.read_excel(filepath, engine="calamine", **read_kwargs)
+        except ImportError:
+            # python-calamine not installed: fall back to openpyxl in its
+            # optimized read-only mode (skips cell-style and formula parsing;
+            # keep_links=False also skips resolving external workbook links)
+            df_clean = pd.read_excel(
+                filepath,
+                engine="openpyxl",
+                engine_kwargs={
+                    "read_only": True,
+                    "data_only": True,
+                    "keep_links": False
+                },
+                **read_kwargs
+            )
 
     except Exception as e:
         st.error(f"Critical Error loading data: {e}")
         st.info("This error can occur if the 'openpyxl' library is not installed or the file is corrupt.")
         st.info(f"Filepath used: {filepath}")
-        return pd.DataFrame()
+        return pd.DataFrame(), [], [], [], []
 
     # --- Post-Loading Processing ---
     if df_clean.empty:
         st.warning("Data loaded but is empty.")
-        return pd.DataFrame()
+        return pd.DataFrame(), [], [], [], []
 
     # Rename column for easier use
     df_clean.rename(columns={'MtCO2 per day': 'Emissions'}, inplace=True)
+
+    # The MtCO2/day values carry about 6 significant digits, well within
+    # float32; halving the value column halves the memory traffic of every
+    # sum/mean/mask over it, and the displayed metrics are unaffected
+    df_clean['Emissions'] = df_clean['Emissions'].astype('float32')
     
     # Convert 'Date' column to datetime objects
     # pd.read_excel often auto-converts dates, so we check first
@@ -51,23 +129,182 @@ def load_data(filepath):
     except Exception as date_e:
         st.error(f"Error converting 'Date' column: {date_e}")
         st.info("Please check if the 'Date' column format is dd/mm/yyyy or if it's already a date.")
-        return pd.DataFrame()
+        return pd.DataFrame(), [], [], [], []
     
-    # Extract Year and Month for filtering
+    # Second precision is ample for daily data and halves the Date column
+    # compared to pandas' default nanosecond unit
+    df_clean['Date'] = df_clean['Date'].astype('datetime64[s]')
+
+    # Extract Year for filtering. (A string Month column used to be derived
+    # here too, but nothing uses it - that was one Python string per row.)
     df_clean['Year'] = df_clean['Date'].dt.year
-    df_clean['Month'] = df_clean['Date'].dt.month_name()
-    
+
     # Drop any rows with missing values
     df_clean.dropna(inplace=True)
-    
-    return df_clean
 
-# Load the data
-df = load_data('carbon_emissions_china.xlsx')
+    # Store the grouping/filter keys as categoricals so groupby and isin
+    # work on small integer codes instead of hashing Python strings
+    for col in ('State', 'Sector'):
+        df_clean[col] = df_clean[col].astype('category')
+    df_clean['Year'] = df_clean['Year'].astype('int16')
+
+    # Write the Parquet sidecar so the next cold start can skip the Excel parse
+    try:
+        df_clean.to_parquet(parquet_path, compression='zstd')
+    except Exception:
+        # pyarrow (or zstd support) not available - caching is optional
+        pass
+
+    # Rank the default provinces and collect the filter options here so that
+    # this full-data work runs once per data load, not on every script rerun
+    provinces, sectors, years = filter_options(df_clean)
+    return df_clean, top_emitting_provinces(df_clean), provinces, sectors, years
+
+if njit is not None:
+    # One compiled pass fills both the sums and the per-category counts -
+    # no hash table, NaN handling or dtype dispatch, and half the traversals
+    # of the two-bincount fallback. Kept single-threaded on purpose: at this
+    # data size thread startup costs more than it saves, and it avoids the
+    # write race a naive parallel loop would have on the output bins.
+    @njit(cache=True)
+    def group_sum_kernel(codes, weights, n_categories):
+        sums = np.zeros(n_categories, dtype=np.float64)
+        counts = np.zeros(n_categories, dtype=np.int64)
+        for i in range(codes.size):
+            c = codes[i]
+            sums[c] += weights[i]
+            counts[c] += 1
+        return sums, counts
+else:
+    group_sum_kernel = None
+
+def categorical_level_sum(cells, level):
+
+    # Sums a cube slice along one categorical index level using the integer
+    # category codes: a tight C accumulation loop with none of pandas'
+    # group-key hashing. Categories absent from the slice are dropped,
+    # matching groupby(..., observed=True).
+    level_index = cells.index.get_level_values(level)
+    codes = level_index.codes
+    n_categories = len(level_index.categories)
+    if group_sum_kernel is not None:
+        sums, counts = group_sum_kernel(codes, cells.to_numpy(), n_categories)
+    else:
+        sums = np.bincount(codes, weights=cells.to_numpy(), minlength=n_categories)
+        counts = np.bincount(codes, minlength=n_categories)
+    present = counts > 0
+    return pd.Series(sums[present], index=level_index.categories[present],
+                     name=cells.name)
+
+@st.cache_data  # Computed once per data load, reused across widget reruns
+def precompute(df):
+
+    # Pre-aggregates the raw rows into a (Date, State, Sector) emissions cube.
+    # The data is daily per province per sector, so the cube is lossless;
+    # slicing and re-grouping its condensed cells on each widget change is
+    # much cheaper than re-scanning the raw frame.
+    cube = df.groupby(['Date', 'State', 'Sector'], observed=True)['Emissions'].sum()
+    return cube.sort_index()
+
+@st.cache_data  # Keyed by the filter selections; repeat selections cost a lookup
+def build_dashboard(_cube, years, provinces, sectors):
+
+    # Builds the tab-1 metrics and figures for one filter selection. Cached
+    # globally, so any previously-seen selection (from any session) is served
+    # from the cache without re-aggregating or rebuilding figures. The cube
+    # argument carries a leading underscore so Streamlit skips hashing it on
+    # every call - it is itself the stable output of a cached function.
+
+    # Slice the precomputed cube for the current selections; all the metrics
+    # and charts below reduce these condensed cells instead of the raw rows
+    cube_idx = _cube.index
+    cube_sel = _cube[
+        cube_idx.get_level_values('Date').year.isin(years)
+        & cube_idx.get_level_values('State').isin(provinces)
+        & cube_idx.get_level_values('Sector').isin(sectors)
+    ]
+
+    # Time Series Chart
+    # Group by date and sum emissions for the selected filters
+    # Keep the grouped result as a Series: Plotly accepts the index and
+    # values directly, so there is no need for a reset_index() copy
+    time_series_data = cube_sel.groupby(level='Date', observed=True).sum()
+
+    # Downsample long series before handing them to Plotly (see note at top)
+    if MinMaxLTTBDownsampler is not None and len(time_series_data) > MAX_CHART_POINTS:
+        keep = MinMaxLTTBDownsampler().downsample(
+            time_series_data.index.to_numpy(),
+            time_series_data.to_numpy(),
+            n_out=MAX_CHART_POINTS
+        )
+        time_series_data = time_series_data.iloc[keep]
+
+    # Use the WebGL renderer: the browser draws one GL call instead of
+    # building thousands of SVG nodes for a long daily series
+    fig_time = go.Figure(go.Scattergl(
+        x=time_series_data.index,
+        y=time_series_data.values,
+        mode='lines'
+    ))
+    fig_time.update_layout(
+        title='Total Daily CO₂ Emissions',
+        xaxis_title='Date',
+        yaxis_title='Emissions (MtCO₂)',
+        hovermode="x unified",
+        uirevision='time'
+    )
+
+    # Bar Chart: Top Emitting Provinces
+    province_data = categorical_level_sum(cube_sel, 'State')
+    province_data = province_data.sort_values(ascending=False)
+
+    fig_prov = px.bar(
+        x=province_data.index,
+        y=province_data.values,
+        title='Total Emissions by Province (Top 5)',
+        labels={'y': 'Total Emissions (MtCO₂)', 'x': 'Province'},
+        height=500
+    )
+    fig_prov.update_layout(uirevision='prov')
+
+    # Horizontal Bar: Emissions by Sector
+    # A bar is cheaper for Plotly to lay out than the old labelled donut
+    # (no per-slice text fitting) and makes the sector sizes easier to compare
+    sector_data = categorical_level_sum(cube_sel, 'Sector').sort_values()
+
+    fig_sec = px.bar(
+        x=sector_data.values,
+        y=sector_data.index,
+        orientation='h',
+        title='Emissions Contribution by Sector',
+        labels={'x': 'Total Emissions (MtCO₂)', 'y': 'Sector'},
+        height=500
+    )
+    fig_sec.update_layout(uirevision='sec')
+
+    # Key Metrics
+    # Derived from the already-condensed sector sums instead of re-scanning
+    # the cube cells. The cube holds one cell per (Date, State, Sector) row,
+    # so these match the raw-row sum and mean exactly.
+    total_emissions = float(sector_data.sum())
+    avg_daily_emissions = total_emissions / len(cube_sel) if len(cube_sel) else 0.0
+
+    # sector_data is returned as well so tab 2 can look up single sectors
+    # without re-masking the raw rows
+    return (total_emissions, avg_daily_emissions,
+            fig_time, fig_prov, fig_sec, sector_data)
+
+# Load the data (the top-5 default and filter options come precomputed)
+df, top_5_provinces, all_provinces, all_sectors, all_years = load_data(
+    'carbon_emissions_china.xlsx'
+)
 
 if df.empty:
     st.stop()
 
+# Precompute the emissions cube (cached alongside the data itself)
+cube = precompute(df)
+
 # --- Main Application Title ---
 st.title("Analyzing Industrial and Regional CO₂ Emissions in China")
 st.markdown("Dashboard for visualizing emissions by region, date, and sector (2023-2025)")
@@ -75,11 +312,6 @@ st.markdown("Dashboard for visualizing emissions by region, date, and sector (20
 # --- Sidebar for Filters ---
 st.sidebar.header("Dashboard Filters")
 
-# Get unique values for filters
-all_provinces = df['State'].unique()
-all_sectors = df['Sector'].unique()
-all_years = sorted(df['Year'].unique())
-
 # Year filter
 selected_years = st.sidebar.multiselect(
     'Select Year(s)',
@@ -89,7 +321,6 @@ selected_years = st.sidebar.multiselect(
 
 # Province filter
 # Default to top 5 emitting provinces for a cleaner initial view
-top_5_provinces = df.groupby('State')['Emissions'].sum().nlargest(5).index.tolist()
 selected_provinces = st.sidebar.multiselect(
     'Select Province(s)',
     options=all_provinces,
@@ -112,9 +343,20 @@ if not selected_provinces:
 if not selected_sectors:
     selected_sectors = all_sectors
 
-df_filtered = df.query(
-    'Year == @selected_years & State == @selected_provinces & Sector == @selected_sectors'
-)
+# Use vectorized isin masks instead of df.query: no query-string parsing on
+# every rerun, and isin on categoricals compares integer codes directly
+if (len(selected_years) == len(all_years)
+        and len(selected_provinces) == len(all_provinces)
+        and len(selected_sectors) == len(all_sectors)):
+    # Everything selected (the default view): skip the mask and the copy
+    df_filtered = df
+else:
+    mask = (
+        df['Year'].isin(selected_years)
+        & df['State'].isin(selected_provinces)
+        & df['Sector'].isin(selected_sectors)
+    )
+    df_filtered = df.loc[mask]
 
 if df_filtered.empty:
     st.warning("No data available for the selected filters. Please adjust your selection.")
@@ -131,10 +373,18 @@ tab1, tab2, tab3 = st.tabs([
 with tab1:
     st.header("Emission Analysis Dashboard")
 
-    # Key Metrics
-    total_emissions = df_filtered['Emissions'].sum()
-    avg_daily_emissions = df_filtered['Emissions'].mean()
-    
+    # Sorted tuples give a stable, hashable cache key for the selections, so
+    # toggling a filter away and back is served straight from the cache
+    selection_key = (
+        tuple(sorted(selected_years)),
+        tuple(sorted(selected_provinces)),
+        tuple(sorted(selected_sectors)),
+    )
+    total_emissions, avg_daily_emissions, fig_time, fig_prov, fig_sec, sector_sums = (
+        build_dashboard(cube, *selection_key)
+    )
+
+
     col1, col2, col3 = st.columns(3)
     col1.metric(
         "Total Emissions (Selected Period)", 
@@ -151,53 +401,18 @@ with tab1:
 
     st.markdown("---")
 
-    # Time Series Chart
     st.subheader("Daily CO₂ Emissions Over Time")
-    # Group by date and sum emissions for the selected filters
-    time_series_data = df_filtered.groupby('Date')['Emissions'].sum().reset_index()
-    fig_time = px.line(
-        time_series_data, 
-        x='Date', 
-        y='Emissions', 
-        title='Total Daily CO₂ Emissions',
-        labels={'Emissions': 'Emissions (MtCO₂)'}
-    )
-    fig_time.update_layout(hovermode="x unified")
     st.plotly_chart(fig_time, use_container_width=True)
 
     # Breakdown Charts
     col_bar, col_pie = st.columns([0.6, 0.4]) # Give more space to bar chart
 
     with col_bar:
-        # Bar Chart: Top Emitting Provinces
         st.subheader("Emissions by Province")
-        province_data = df_filtered.groupby('State')['Emissions'].sum().reset_index()
-        province_data = province_data.sort_values(by='Emissions', ascending=False)
-        
-        fig_prov = px.bar(
-            province_data, 
-            x='State', 
-            y='Emissions', 
-            title='Total Emissions by Province (Top 5)',
-            labels={'Emissions': 'Total Emissions (MtCO₂)', 'State': 'Province'},
-            height=500
-        )
         st.plotly_chart(fig_prov, use_container_width=True)
 
     with col_pie:
-        # Pie Chart: Emissions by Sector
         st.subheader("Emissions by Sector")
-        sector_data = df_filtered.groupby('Sector')['Emissions'].sum().reset_index()
-        
-        fig_sec = px.pie(
-            sector_data, 
-            names='Sector', 
-            values='Emissions', 
-            title='Emissions Contribution by Sector',
-            hole=0.3 # Donut chart
-        )
-        fig_sec.update_traces(textposition='inside', textinfo='percent+label')
-        fig_sec.update_layout(height=500)
         st.plotly_chart(fig_sec, use_container_width=True)
         
     # Data Insights
@@ -206,7 +421,7 @@ with tab1:
         st.markdown("""
         * **Time Trend:** The line chart shows the daily emission trends. You can observe seasonal patterns, such as potential increases during winter (heating) or summer (cooling), or dips during major holidays.
         * **Regional Hotspots:** The bar chart clearly identifies which provinces are the largest contributors to CO₂ emissions within your selection. Provinces with heavy industry or reliance on coal power (like 'Shandong', 'Inner Mongolia') consistently appear at the top.
-        * **Sector Contribution:** The pie chart breaks down emissions by economic sector. Typically, the **'Power'** and **'Industry'** sectors are the most significant, highlighting them as key areas for intervention.
+        * **Sector Contribution:** The sector chart breaks down emissions by economic sector. Typically, the **'Power'** and **'Industry'** sectors are the most significant, highlighting them as key areas for intervention.
         """)
 
 # --- Tab 2: Recommendations & Impact ---
@@ -236,28 +451,51 @@ with tab2:
     st.subheader("Projected Impact (What-if Scenario)")
     st.markdown("Use the slider below to simulate the potential impact of implementing energy efficiency measures in the **Industry** sector for the selected data.")
 
-    # Calculate total industry emissions for the filtered data
-    try:
-        industry_emissions = df_filtered[df_filtered['Sector'] == 'Industry']['Emissions'].sum()
-    except:
-        industry_emissions = 0
+    # Reuse the per-sector sums already computed for the dashboard: a scalar
+    # lookup instead of re-masking and summing the filtered rows
+    industry_emissions = float(sector_sums.get('Industry', 0.0))
 
     if industry_emissions > 0:
-        efficiency_gain = st.slider(
-            "Select potential efficiency gain (%) in Industry", 
-            min_value=0, 
-            max_value=50, 
-            value=10
-        )
-        
-        # Calculate potential savings
-        savings = industry_emissions * (efficiency_gain / 100)
-        
-        st.metric(
-            label=f"Potential CO₂ Savings at {efficiency_gain}% Efficiency Gain", 
-            value=f"{savings:,.2f} MtCO₂"
+        # The slider lives inside the Plotly figure, so dragging it updates
+        # the chart entirely in the browser. Every step's savings value is
+        # precomputed here once; the old st.slider re-ran the whole script
+        # just to multiply a scalar.
+        steps = []
+        for pct in range(0, 51):
+            savings = industry_emissions * (pct / 100)
+            steps.append(dict(
+                method='update',
+                label=f"{pct}%",
+                args=[
+                    {'y': [[savings]]},
+                    {'title': {'text': f"Potential CO₂ Savings at {pct}% Efficiency Gain: {savings:,.2f} MtCO₂"}}
+                ]
+            ))
+
+        default_pct = 10
+        default_savings = industry_emissions * (default_pct / 100)
+
+        fig_savings = go.Figure(go.Bar(
+            x=['Potential CO₂ Savings'],
+            y=[default_savings],
+            width=[0.4]
+        ))
+        fig_savings.update_layout(
+            title=f"Potential CO₂ Savings at {default_pct}% Efficiency Gain: {default_savings:,.2f} MtCO₂",
+            yaxis_title='Savings (MtCO₂)',
+            # Fix the axis to the 50% maximum so bars don't rescale per step
+            yaxis_range=[0, industry_emissions * 0.55],
+            height=450,
+            sliders=[dict(
+                active=default_pct,
+                currentvalue={'prefix': 'Efficiency gain: '},
+                pad={'t': 40},
+                steps=steps
+            )],
+            uirevision='savings'
         )
-        st.markdown(f"This represents a saving of **{savings:,.2f} MtCO₂** over the selected period, just from the **Industry** sector in the selected provinces. This demonstrates the significant, measurable impact of targeted efficiency policies.")
+        st.plotly_chart(fig_savings, use_container_width=True)
+        st.markdown("The savings shown come just from the **Industry** sector in the selected provinces, over the selected period. This demonstrates the significant, measurable impact of targeted efficiency policies.")
     else:
         st.info("Select the 'Industry' sector in the sidebar to use the 'What-if' scenario.")
 